@@ -1,10 +1,31 @@
 from .helper import LMSException
-from .binIO import BinaryMemoryIO
+from .binIO import BinaryMemoryIO, EOFException
 from typing import Callable, Any
 from abc import ABC
+import codecs
+import os
 
 __all__ = ["LMSAdapter"]
 
+# Square brackets and backslashes outside of tags are preserved by putting a backslash in front of them
+__ESCAPE_TABLE__ = str.maketrans({"[": "\\[", "]": "\\]", "\\": "\\\\"})
+
+# Number of bytes that follow a UTF-8 character's leading byte, indexed by the leading byte
+__UTF_8_EXTRA_BYTES__ = bytes(
+    5 if 0xFC <= b < 0xFE else
+    4 if 0xF8 <= b < 0xFC else
+    3 if 0xF0 <= b < 0xF8 else
+    2 if 0xE0 <= b < 0xF0 else
+    1 if 0xC0 <= b < 0xE0 else
+    0 for b in range(256)
+)
+
+# The UTF-16 codecs are looked up once. Unlike UTF-8, str.encode and bytes.decode would look them up on every call.
+__UTF_16_BE_DECODE__ = codecs.getdecoder("utf-16-be")
+__UTF_16_BE_ENCODE__ = codecs.getencoder("utf-16-be")
+__UTF_16_LE_DECODE__ = codecs.getdecoder("utf-16-le")
+__UTF_16_LE_ENCODE__ = codecs.getencoder("utf-16-le")
+
 
 class LMSAdapter(ABC):
     """
@@ -12,23 +33,26 @@ class LMSAdapter(ABC):
     attributes, and more. In other words, an adapter controls can control how the library will deal with MSBT and MSBF
     files.
     """
+    _MAX_CACHED_TAGS_ = 1024
+
     def __init__(self):
         self._charset_: str = "utf-16-be"
         self._is_big_endian_: bool = True
         self._read_char_func_: Callable[[BinaryMemoryIO], str] = __read_utf_16_be_char__
         self._write_char_func_: Callable[[BinaryMemoryIO, str], int] = __write_utf_16_be__
+        self._read_tag_cache_: dict[bytes, str] = {}
+        self._write_tag_cache_: dict[str, bytes] = {}
 
     def create_stream(self, initial_capacity: int = 0) -> BinaryMemoryIO:
         """
         Creates a new in-memory byte stream with the specified initial capacity. The stream will use the adapter's
-        endianness.
+        endianness. The initial capacity is filled with zeroes and counts towards the stream's size, while the stream's
+        position starts at the beginning.
 
         :param initial_capacity: the initial capacity.
         :return: the newly constructed stream.
         """
-        stream = BinaryMemoryIO(bytes(initial_capacity), big_endian=self._is_big_endian_)
-        stream.seek(0)
-        return stream
+        return BinaryMemoryIO(bytes(initial_capacity), big_endian=self._is_big_endian_)
 
     @property
     def charset(self) -> str:
@@ -53,6 +77,7 @@ class LMSAdapter(ABC):
             raise LMSException("Invalid charset")
 
         self._charset_ = charset
+        self._clear_tag_caches_()
 
     def set_big_endian(self):
         """
@@ -65,6 +90,7 @@ class LMSAdapter(ABC):
             self._write_char_func_ = __write_utf_16_be__
 
         self._is_big_endian_ = True
+        self._clear_tag_caches_()
 
     def set_little_endian(self):
         """
@@ -77,6 +103,7 @@ class LMSAdapter(ABC):
             self._write_char_func_ = __write_utf_16_le__
 
         self._is_big_endian_ = False
+        self._clear_tag_caches_()
 
     @property
     def is_big_endian(self) -> bool:
@@ -96,11 +123,37 @@ class LMSAdapter(ABC):
         """True if MSBT or MSBF files should use a fixed number of hash buckets, otherwise False."""
         return False
 
+    @property
+    def supports_pow2_buckets(self) -> bool:
+        """
+        True if the game associated with the adapter accepts MSBF label tables whose number of hash buckets is a power
+        of two, otherwise False. If True, MSBF label tables use the first power of two that is at least twice the number
+        of flowcharts as their number of hash buckets. This has no effect if ``use_fixed_buckets`` is True.
+        """
+        return False
+
+    @property
+    def optimize_buckets(self) -> bool:
+        """
+        True if MSBT or MSBF label tables should use whichever of the next few prime numbers of hash buckets spreads the
+        labels most evenly, otherwise False. This has no effect if ``use_fixed_buckets`` is True.
+        """
+        return False
+
     @property
     def supports_flows(self) -> bool:
         """True if the game associated with the adapter supports flowcharts (i.e. MSBF files), otherwise False."""
         return False
 
+    @property
+    def cache_tags(self) -> bool:
+        """
+        True if the string representations of read tags and the binary representations of written tags may be cached
+        and reused for identical tags, otherwise False. Only adapters whose ``read_tag`` and ``write_tag`` results
+        depend on nothing but the tag itself should return True.
+        """
+        return False
+
     # ------------------------------------------------------------------------------------------------------------------
     # Text I/O
     # ------------------------------------------------------------------------------------------------------------------
@@ -133,7 +186,45 @@ class LMSAdapter(ABC):
         :param stream: the stream to read from.
         :return: the read text.
         """
-        text = ""
+        # Characters have to be read one by one if the adapter reads them on its own
+        if type(self).read_char is not LMSAdapter.read_char:
+            return self._read_text_by_char_(stream)
+
+        charset = self._charset_
+        null_unit = "\u0000".encode(charset)
+        tag_unit = "\u000E".encode(charset)
+        unit_size = len(null_unit)
+
+        # Scan the underlying buffer for control characters and decode the runs in between them all at once
+        buffer = stream.getvalue()
+        start = stream.tell()
+        end = -1
+        parts: list[str] = []
+
+        while True:
+            # Tags may have an odd length, so the terminator has to be searched again if it is no longer aligned
+            if end < start or (end - start) % unit_size:
+                end = __find_code_unit__(buffer, null_unit, start, len(buffer))
+
+            tag = __find_code_unit__(buffer, tag_unit, start, end if end >= 0 else len(buffer))
+
+            if tag < 0:
+                if end < 0:
+                    raise EOFException
+
+                parts.append(buffer[start:end].decode(charset).translate(__ESCAPE_TABLE__))
+                stream.seek(end + unit_size)
+                break
+
+            parts.append(buffer[start:tag].decode(charset).translate(__ESCAPE_TABLE__))
+            stream.seek(tag + unit_size)
+            parts.append(self._read_cached_tag_(stream, buffer))
+            start = stream.tell()
+
+        return "".join(parts)
+
+    def _read_text_by_char_(self, stream: BinaryMemoryIO) -> str:
+        parts: list[str] = []
 
         while True:
             ch = self.read_char(stream)
@@ -141,17 +232,11 @@ class LMSAdapter(ABC):
             if ch == "\u0000":
                 break
             elif ch == "\u000E":
-                text += self.read_tag(stream)
-            elif ch == "[":
-                text += '\\['
-            elif ch == "]":
-                text += "\\]"
-            elif ch == "\\":
-                text += "\\\\"
+                parts.append(self._read_cached_tag_(stream, stream.getvalue()))
             else:
-                text += ch
+                parts.append(ch.translate(__ESCAPE_TABLE__))
 
-        return text
+        return "".join(parts)
 
     def read_tag(self, stream: BinaryMemoryIO) -> str:
         """
@@ -173,36 +258,113 @@ class LMSAdapter(ABC):
         :param stream: the stream to write to.
         :param text: the text to be written.
         """
-        tag_start = 0
-        escape = False
         index = 0
+        length = len(text)
+        tag_start = -1
+
+        # Plain characters are collected and only written once a tag follows or the text ends
+        pending: list[str] = []
+
+        while index < length:
+            # Find the next special character, plain characters are skipped at once
+            special = length
+
+            for special_char in "[]\\":
+                found = text.find(special_char, index, special)
+
+                if found >= 0:
+                    special = found
+
+            # Characters inside a tag belong to the tag string, all others are written as they are
+            if tag_start < 0 and special > index:
+                pending.append(text[index:special])
+
+            if special == length:
+                index = length
+                break
+
+            if text[special] == "\\":
+                # Escaped characters are written as they are, even if they appear inside a tag
+                if special + 1 == length:
+                    break
+
+                pending.append(text[special + 1])
+                index = special + 2
+            elif text[special] == "[":
+                # Another opener discards the incomplete tag before it
+                tag_start = special + 1
+                index = tag_start
+            elif tag_start >= 0:
+                if pending:
+                    self.write_chars(stream, "".join(pending))
+                    pending.clear()
+
+                self._write_cached_tag_(stream, text[tag_start:special])
+                tag_start = -1
+                index = special + 1
+            else:
+                raise LMSException("Tag closer found without opener")
 
-        while index < len(text):
-            if escape:
-                self.write_chars(stream, text[index])
-                escape = False
-            elif text[index] == "\\":
-                escape = True
-            elif text[index] == "]":
-                if tag_start > 0:
-                    tag_string = text[tag_start:index]
-                    self.write_tag(stream, tag_string)
-                    tag_start = 0
-                else:
-                    raise LMSException("Tag closer found without opener")
-            elif text[index] == "[":
-                tag_start = index + 1
-            elif tag_start == 0:
-                self.write_chars(stream, text[index])
-
-            index += 1
-
-        if tag_start > 0:
+        if tag_start >= 0:
             raise LMSException("Tag not closed")
-        if escape:
+        if index < length:
             raise LMSException("No character to escape")
 
-        self.write_chars(stream, "\u0000")
+        pending.append("\u0000")
+        self.write_chars(stream, "".join(pending))
+
+    def write_texts(self, stream: BinaryMemoryIO, texts: list[str]) -> list[int]:
+        """
+        Writes the given text strings back-to-back to the stream just like ``write_text`` would and returns the offsets
+        at which each text starts. Unless ``write_text`` or ``write_chars`` are overridden, consecutive texts without
+        tags or escaped characters are encoded at once.
+
+        :param stream: the stream to write to.
+        :param texts: the texts to be written.
+        :return: the list of offsets of all written texts.
+        """
+        offsets: list[int] = []
+        adapter_type = type(self)
+
+        if (adapter_type.write_text is not LMSAdapter.write_text
+                or adapter_type.write_chars is not LMSAdapter.write_chars):
+            for text in texts:
+                offsets.append(stream.tell())
+                self.write_text(stream, text)
+
+            return offsets
+
+        plain_texts: list[str] = []
+
+        for text in texts:
+            if "[" in text or "]" in text or "\\" in text or "\u0000" in text:
+                if plain_texts:
+                    self._write_plain_texts_(stream, plain_texts, offsets)
+                    plain_texts.clear()
+
+                offsets.append(stream.tell())
+                self.write_text(stream, text)
+            else:
+                plain_texts.append(text)
+
+        if plain_texts:
+            self._write_plain_texts_(stream, plain_texts, offsets)
+
+        return offsets
+
+    def _write_plain_texts_(self, stream: BinaryMemoryIO, texts: list[str], offsets: list[int]):
+        # None of the texts contain null characters, so each encoded null character terminates the next text
+        terminator = "\u0000".encode(self.charset)
+        encoded = ("\u0000".join(texts) + "\u0000").encode(self.charset)
+        start = stream.tell()
+        end = len(encoded)
+        index = 0
+
+        for _ in texts:
+            offsets.append(start + index)
+            index = __find_code_unit__(encoded, terminator, index, end) + len(terminator)
+
+        stream.write(encoded)
 
     def write_tag(self, stream: BinaryMemoryIO, tag: str):
         """
@@ -215,6 +377,57 @@ class LMSAdapter(ABC):
         """
         raise NotImplementedError()
 
+    def _read_cached_tag_(self, stream: BinaryMemoryIO, buffer: bytes) -> str:
+        # Tags are repeated a lot, so their string representations are cached by their raw bytes. The length of a tag is
+        # known from its header, which consists of the group ID, tag ID and data size.
+        if not self.cache_tags:
+            return self.read_tag(stream)
+
+        start = stream.tell()
+        header = buffer[start:start + 6]
+
+        if len(header) != 6:
+            return self.read_tag(stream)
+
+        end = start + 6 + int.from_bytes(header[4:6], "big" if stream.is_big_endian else "little")
+        raw = buffer[start:end]
+        tag = self._read_tag_cache_.get(raw)
+
+        if tag is not None:
+            stream.seek(end)
+            return tag
+
+        tag = self.read_tag(stream)
+
+        # Only cache tags whose length matches the one declared in their header
+        if stream.tell() == end and len(self._read_tag_cache_) < self._MAX_CACHED_TAGS_:
+            self._read_tag_cache_[raw] = tag
+
+        return tag
+
+    def _write_cached_tag_(self, stream: BinaryMemoryIO, tag: str):
+        if not self.cache_tags:
+            self.write_tag(stream, tag)
+            return
+
+        raw = self._write_tag_cache_.get(tag)
+
+        if raw is not None:
+            stream.write(raw)
+            return
+
+        start = stream.tell()
+        self.write_tag(stream, tag)
+        end = stream.tell()
+
+        if end >= start and len(self._write_tag_cache_) < self._MAX_CACHED_TAGS_:
+            with stream.getbuffer() as buffer:
+                self._write_tag_cache_[tag] = buffer[start:end].tobytes()
+
+    def _clear_tag_caches_(self):
+        self._read_tag_cache_.clear()
+        self._write_tag_cache_.clear()
+
     # ------------------------------------------------------------------------------------------------------------------
     # Attributes interface
     # ------------------------------------------------------------------------------------------------------------------
@@ -228,6 +441,22 @@ class LMSAdapter(ABC):
         """The length (in bytes) of every message's attributes. This should return a positive integer or zero."""
         return 0
 
+    @property
+    def attributes_format(self) -> str | None:
+        """
+        The struct format (without a byte order character) of every message's attributes if they are a flat record
+        whose fields are listed by ``attributes_fields``, otherwise None. If set, ATR1 sections are read and written in
+        bulk and neither ``parse_attributes`` nor ``write_attributes`` will be called. An LMSException is thrown if the
+        format's size does not match the length of the ATR1 entries or if its number of fields differs from
+        ``attributes_fields``.
+        """
+        return None
+
+    @property
+    def attributes_fields(self) -> tuple[str, ...]:
+        """The names of the attributes stored in the fields of ``attributes_format``, in the same order."""
+        return ()
+
     def create_default_attributes(self) -> dict[str, Any]:
         """
         Creates and returns a dictionary consisting of default message attributes.
@@ -276,6 +505,26 @@ class LMSAdapter(ABC):
 # ------------------------------------------------------------------------------------------------------------------
 # Helper functions to read and write characters
 # ------------------------------------------------------------------------------------------------------------------
+def __find_code_unit__(buffer: bytes, unit: bytes, start: int, end: int) -> int:
+    """
+    Searches the buffer for the first occurrence of the encoded code unit between start and end. Only occurrences that
+    are aligned to the code unit's size relative to start are considered, so the second half of one UTF-16 code unit and
+    the first half of the next one won't be mistaken for a match.
+
+    :param buffer: the buffer to search.
+    :param unit: the encoded code unit to search for.
+    :param start: the offset to start searching at.
+    :param end: the offset to stop searching at.
+    :return: the offset of the code unit or -1 if it could not be found.
+    """
+    index = buffer.find(unit, start, end)
+
+    while index >= 0 and (index - start) % len(unit):
+        index = buffer.find(unit, index + 1, end)
+
+    return index
+
+
 def __read_utf_8_char__(stream: BinaryMemoryIO) -> str:
     """
     Reads from the stream a character encoded in 'utf-8' format and returns it.
@@ -284,21 +533,17 @@ def __read_utf_8_char__(stream: BinaryMemoryIO) -> str:
     :return: the read character.
     """
     byte = stream.read_u8()
-    buffer = bytearray()
-    buffer.append(byte)
-
-    if byte >= 0xFE:
-        pass
-    elif byte >= 0xFC:
-        buffer += stream.read(5)
-    elif byte >= 0xF8:
-        buffer += stream.read(4)
-    elif byte >= 0xF0:
-        buffer += stream.read(3)
-    elif byte >= 0xE0:
-        buffer += stream.read(2)
-    elif byte >= 0xC0:
-        buffer += stream.read(1)
+
+    if byte < 0x80:
+        return chr(byte)
+
+    # Step back to read the leading byte and its continuation bytes at once
+    size = 1 + __UTF_8_EXTRA_BYTES__[byte]
+    stream.seek(-1, os.SEEK_CUR)
+    buffer = stream.read(size)
+
+    if len(buffer) != size:
+        raise EOFException
 
     return buffer.decode("utf-8")
 
@@ -325,7 +570,18 @@ def __read_utf_16_be_char__(stream: BinaryMemoryIO) -> str:
     :return: the read character.
     """
     buffer = stream.read(2)
-    return buffer.decode("utf-16-be")
+
+    if len(buffer) != 2:
+        raise EOFException
+
+    code = (buffer[0] << 8) | buffer[1]
+
+    # Surrogates are rare, so leave pairing and validating them to the codec
+    if 0xD800 <= code <= 0xDFFF:
+        buffer += stream.read(2)
+        return __UTF_16_BE_DECODE__(buffer)[0]
+
+    return chr(code)
 
 
 def __write_utf_16_be__(stream: BinaryMemoryIO, string: str) -> int:
@@ -337,7 +593,7 @@ def __write_utf_16_be__(stream: BinaryMemoryIO, string: str) -> int:
     :param string: the characters to be written.
     :return: the number of bytes written.
     """
-    buffer = string.encode("utf-16-be")
+    buffer = __UTF_16_BE_ENCODE__(string)[0]
     stream.write(buffer)
     return len(buffer)
 
@@ -350,7 +606,18 @@ def __read_utf_16_le_char__(stream: BinaryMemoryIO) -> str:
     :return: the read character.
     """
     buffer = stream.read(2)
-    return buffer.decode("utf-16-le")
+
+    if len(buffer) != 2:
+        raise EOFException
+
+    code = buffer[0] | (buffer[1] << 8)
+
+    # Surrogates are rare, so leave pairing and validating them to the codec
+    if 0xD800 <= code <= 0xDFFF:
+        buffer += stream.read(2)
+        return __UTF_16_LE_DECODE__(buffer)[0]
+
+    return chr(code)
 
 
 def __write_utf_16_le__(stream: BinaryMemoryIO, string: str) -> int:
@@ -362,6 +629,6 @@ def __write_utf_16_le__(stream: BinaryMemoryIO, string: str) -> int:
     :param string: the characters to be written.
     :return: the number of bytes written.
     """
-    buffer = string.encode("utf-16-le")
+    buffer = __UTF_16_LE_ENCODE__(string)[0]
     stream.write(buffer)
     return len(buffer)
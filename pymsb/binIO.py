@@ -1,9 +1,29 @@
+import array
 import io
 import struct
 import os
+import sys
 
 __all__ = ["BinaryMemoryIO", "EOFException", "BOMException"]
 
+# Structs for all primitives whose byte order matters
+__STR_U16_BE__ = struct.Struct(">H")
+__STR_U16_LE__ = struct.Struct("<H")
+__STR_S16_BE__ = struct.Struct(">h")
+__STR_S16_LE__ = struct.Struct("<h")
+__STR_U32_BE__ = struct.Struct(">I")
+__STR_U32_LE__ = struct.Struct("<I")
+__STR_S32_BE__ = struct.Struct(">i")
+__STR_S32_LE__ = struct.Struct("<i")
+__STR_U64_BE__ = struct.Struct(">Q")
+__STR_U64_LE__ = struct.Struct("<Q")
+__STR_S64_BE__ = struct.Struct(">q")
+__STR_S64_LE__ = struct.Struct("<q")
+__STR_F32_BE__ = struct.Struct(">f")
+__STR_F32_LE__ = struct.Struct("<f")
+__STR_F64_BE__ = struct.Struct(">d")
+__STR_F64_LE__ = struct.Struct("<d")
+
 
 class EOFException(Exception):
     """Signals an attempt at reading beyond a stream."""
@@ -20,25 +40,26 @@ class BinaryMemoryIO(io.BytesIO):
     A buffered I/O implementation using an in-memory bytes buffer to store data. Provides methods to read or write
     primitive data.
     """
+    # The primitive structs used to be class attributes, they are still available here for backwards compatibility
     __STR_BOOL__ = struct.Struct("?")
     __STR_U8__ = struct.Struct("B")
     __STR_S8__ = struct.Struct("b")
-    __STR_U16_BE__ = struct.Struct(">H")
-    __STR_U16_LE__ = struct.Struct("<H")
-    __STR_S16_BE__ = struct.Struct(">h")
-    __STR_S16_LE__ = struct.Struct("<h")
-    __STR_U32_BE__ = struct.Struct(">I")
-    __STR_U32_LE__ = struct.Struct("<I")
-    __STR_S32_BE__ = struct.Struct(">i")
-    __STR_S32_LE__ = struct.Struct("<i")
-    __STR_U64_BE__ = struct.Struct(">Q")
-    __STR_U64_LE__ = struct.Struct("<Q")
-    __STR_S64_BE__ = struct.Struct(">q")
-    __STR_S64_LE__ = struct.Struct("<q")
-    __STR_F32_BE__ = struct.Struct(">f")
-    __STR_F32_LE__ = struct.Struct("<f")
-    __STR_F64_BE__ = struct.Struct(">d")
-    __STR_F64_LE__ = struct.Struct("<d")
+    __STR_U16_BE__ = __STR_U16_BE__
+    __STR_U16_LE__ = __STR_U16_LE__
+    __STR_S16_BE__ = __STR_S16_BE__
+    __STR_S16_LE__ = __STR_S16_LE__
+    __STR_U32_BE__ = __STR_U32_BE__
+    __STR_U32_LE__ = __STR_U32_LE__
+    __STR_S32_BE__ = __STR_S32_BE__
+    __STR_S32_LE__ = __STR_S32_LE__
+    __STR_U64_BE__ = __STR_U64_BE__
+    __STR_U64_LE__ = __STR_U64_LE__
+    __STR_S64_BE__ = __STR_S64_BE__
+    __STR_S64_LE__ = __STR_S64_LE__
+    __STR_F32_BE__ = __STR_F32_BE__
+    __STR_F32_LE__ = __STR_F32_LE__
+    __STR_F64_BE__ = __STR_F64_BE__
+    __STR_F64_LE__ = __STR_F64_LE__
 
     def __init__(self, initial_bytes=bytes(), big_endian: bool = True):
         super().__init__(initial_bytes)
@@ -70,30 +91,56 @@ class BinaryMemoryIO(io.BytesIO):
     def size(self) -> int:
         """Returns the current size in bytes."""
         old = self.tell()
-        self.seek(0, os.SEEK_END)
-        size = self.tell()
+        size = self.seek(0, os.SEEK_END)
         self.seek(old)
         return size
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def __get_struct__(self, big_endian_struct: struct.Struct, little_endian_struct: struct.Struct):
-        return big_endian_struct if self.__big_endian__ else little_endian_struct
-
     def __read_primitive__(self, big_endian_struct: struct.Struct, little_endian_struct: struct.Struct):
-        strct = self.__get_struct__(big_endian_struct, little_endian_struct)
+        strct = big_endian_struct if self.__big_endian__ else little_endian_struct
         raw = self.read(strct.size)
 
         if len(raw) == strct.size:
-            return strct.unpack_from(raw, 0)[0]
+            return strct.unpack(raw)[0]
         else:
             raise EOFException
 
     def __write_primitive__(self, val, big_endian_struct: struct.Struct, little_endian_struct: struct.Struct):
-        strct = self.__get_struct__(big_endian_struct, little_endian_struct)
+        strct = big_endian_struct if self.__big_endian__ else little_endian_struct
         raw = strct.pack(val)
         self.write(raw)
 
+    def __write_primitive_at__(self, offset: int, val, big_endian_struct: struct.Struct,
+                               little_endian_struct: struct.Struct):
+        strct = big_endian_struct if self.__big_endian__ else little_endian_struct
+
+        with self.getbuffer() as buffer:
+            strct.pack_into(buffer, offset, val)
+
+    def __read_array__(self, typecode: str, count: int) -> array.array:
+        values = array.array(typecode)
+        size = values.itemsize * count
+        raw = self.read(size)
+
+        if len(raw) != size:
+            raise EOFException
+
+        values.frombytes(raw)
+
+        if self.__big_endian__ != (sys.byteorder == "big"):
+            values.byteswap()
+
+        return values
+
+    def __write_array__(self, vals, typecode: str):
+        values = array.array(typecode, vals)
+
+        if self.__big_endian__ != (sys.byteorder == "big"):
+            values.byteswap()
+
+        self.write(values.tobytes())
+
     # ------------------------------------------------------------------------------------------------------------------
 
     def skip(self, count: int):
@@ -105,7 +152,7 @@ class BinaryMemoryIO(io.BytesIO):
         if count < 0:
             raise ValueError("Negative skipping is not allowed")
 
-        self.seek(self.tell() + count)
+        self.seek(count, os.SEEK_CUR)
 
     def read_u8(self):
         """Reads from the stream an unsigned byte ([0, 255]) and returns it."""
@@ -118,86 +165,163 @@ class BinaryMemoryIO(io.BytesIO):
 
     def read_s8(self) -> int:
         """Reads from the stream a signed byte ([-128, 127]) and returns it."""
-        return self.__read_primitive__(self.__STR_S8__, self.__STR_S8__)
+        v = self.read(1)
+
+        if len(v) == 1:
+            return v[0] - 256 if v[0] >= 128 else v[0]
+        else:
+            raise EOFException
 
     def read_bool(self) -> bool:
         """Reads from the stream an unsigned byte ([0, 255]) and returns it."""
-        return self.__read_primitive__(self.__STR_BOOL__, self.__STR_BOOL__)
+        v = self.read(1)
+
+        if len(v) == 1:
+            return v[0] != 0
+        else:
+            raise EOFException
 
     def read_u16(self):
         """Reads from the stream an unsigned short ([0, 65535]) and returns it."""
-        return self.__read_primitive__(self.__STR_U16_BE__, self.__STR_U16_LE__)
+        return self.__read_primitive__(__STR_U16_BE__, __STR_U16_LE__)
 
     def read_s16(self):
         """Reads from the stream a signed short ([-32768, 32767]) and returns it."""
-        return self.__read_primitive__(self.__STR_S16_BE__, self.__STR_S16_LE__)
+        return self.__read_primitive__(__STR_S16_BE__, __STR_S16_LE__)
 
     def read_u32(self):
         """Reads from the stream an unsigned int ([0, 2^32-1]) and returns it."""
-        return self.__read_primitive__(self.__STR_U32_BE__, self.__STR_U32_LE__)
+        return self.__read_primitive__(__STR_U32_BE__, __STR_U32_LE__)
 
     def read_s32(self):
         """Reads from the stream a signed int ([-2^31, 2^31-1]) and returns it."""
-        return self.__read_primitive__(self.__STR_S32_BE__, self.__STR_S32_LE__)
+        return self.__read_primitive__(__STR_S32_BE__, __STR_S32_LE__)
 
     def read_u64(self):
         """Reads from the stream an unsigned long ([0, 2^64-1]) and returns it."""
-        return self.__read_primitive__(self.__STR_U64_BE__, self.__STR_U64_LE__)
+        return self.__read_primitive__(__STR_U64_BE__, __STR_U64_LE__)
 
     def read_s64(self):
         """Reads from the stream a signed long ([-2^63, 2^63-1]) and returns it."""
-        return self.__read_primitive__(self.__STR_S64_BE__, self.__STR_S64_LE__)
+        return self.__read_primitive__(__STR_S64_BE__, __STR_S64_LE__)
 
     def read_f32(self):
         """Reads from the stream a single-precision float and returns it."""
-        return self.__read_primitive__(self.__STR_F32_BE__, self.__STR_F32_LE__)
+        return self.__read_primitive__(__STR_F32_BE__, __STR_F32_LE__)
 
     def read_f64(self):
         """Reads from the stream a double-precision float and returns it."""
-        return self.__read_primitive__(self.__STR_F64_BE__, self.__STR_F64_LE__)
+        return self.__read_primitive__(__STR_F64_BE__, __STR_F64_LE__)
+
+    def read_u16_array(self, count: int) -> array.array:
+        """Reads from the stream the specified number of unsigned shorts and returns them."""
+        return self.__read_array__("H", count)
+
+    def read_s16_array(self, count: int) -> array.array:
+        """Reads from the stream the specified number of signed shorts and returns them."""
+        return self.__read_array__("h", count)
+
+    def read_u32_array(self, count: int) -> array.array:
+        """Reads from the stream the specified number of unsigned ints and returns them."""
+        return self.__read_array__("I", count)
+
+    def read_s32_array(self, count: int) -> array.array:
+        """Reads from the stream the specified number of signed ints and returns them."""
+        return self.__read_array__("i", count)
+
+    def read_f32_array(self, count: int) -> array.array:
+        """Reads from the stream the specified number of single-precision floats and returns them."""
+        return self.__read_array__("f", count)
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def write_u8(self, val: int):
         """Writes the specified unsigned byte to the stream."""
-        self.__write_primitive__(val, self.__STR_U8__, self.__STR_U8__)
+        if not 0 <= val <= 255:
+            raise struct.error("ubyte format requires 0 <= number <= 255")
+
+        self.write(bytes((val,)))
 
     def write_s8(self, val: int):
         """Writes the specified signed byte to the stream."""
-        self.__write_primitive__(val, self.__STR_S8__, self.__STR_S8__)
+        if not -128 <= val <= 127:
+            raise struct.error("byte format requires -128 <= number <= 127")
+
+        self.write(bytes((val & 0xFF,)))
 
     def write_bool(self, val: int):
         """Writes the specified bool to the stream."""
-        self.__write_primitive__(val, self.__STR_BOOL__, self.__STR_BOOL__)
+        self.write(b"\x01" if val else b"\x00")
 
     def write_u16(self, val: int):
         """Writes the specified unsigned short to the stream."""
-        self.__write_primitive__(val, self.__STR_U16_BE__, self.__STR_U16_LE__)
+        self.__write_primitive__(val, __STR_U16_BE__, __STR_U16_LE__)
 
     def write_s16(self, val: int):
         """Writes the specified signed short to the stream."""
-        self.__write_primitive__(val, self.__STR_S16_BE__, self.__STR_S16_LE__)
+        self.__write_primitive__(val, __STR_S16_BE__, __STR_S16_LE__)
 
     def write_u32(self, val: int):
         """Writes the specified unsigned int to the stream."""
-        self.__write_primitive__(val, self.__STR_U32_BE__, self.__STR_U32_LE__)
+        self.__write_primitive__(val, __STR_U32_BE__, __STR_U32_LE__)
 
     def write_s32(self, val: int):
         """Writes the specified signed int to the stream."""
-        self.__write_primitive__(val, self.__STR_S32_BE__, self.__STR_S32_LE__)
+        self.__write_primitive__(val, __STR_S32_BE__, __STR_S32_LE__)
 
     def write_u64(self, val: int):
         """Writes the specified unsigned long to the stream."""
-        self.__write_primitive__(val, self.__STR_U64_BE__, self.__STR_U64_LE__)
+        self.__write_primitive__(val, __STR_U64_BE__, __STR_U64_LE__)
 
     def write_s64(self, val: int):
         """Writes the specified signed long to the stream."""
-        self.__write_primitive__(val, self.__STR_S64_BE__, self.__STR_S64_LE__)
+        self.__write_primitive__(val, __STR_S64_BE__, __STR_S64_LE__)
 
     def write_f32(self, val: float):
         """Writes the specified single-precision float to the stream."""
-        self.__write_primitive__(val, self.__STR_F32_BE__, self.__STR_F32_LE__)
+        self.__write_primitive__(val, __STR_F32_BE__, __STR_F32_LE__)
 
     def write_f64(self, val: float):
         """Writes the specified double-precision float to the stream."""
-        self.__write_primitive__(val, self.__STR_F64_BE__, self.__STR_F64_LE__)
+        self.__write_primitive__(val, __STR_F64_BE__, __STR_F64_LE__)
+
+    def write_u16_at(self, offset: int, val: int):
+        """
+        Writes the specified unsigned short at the given offset without moving the stream position. The offset has to
+        lie within the stream's current size.
+        """
+        self.__write_primitive_at__(offset, val, __STR_U16_BE__, __STR_U16_LE__)
+
+    def write_u32_at(self, offset: int, val: int):
+        """
+        Writes the specified unsigned int at the given offset without moving the stream position. The offset has to lie
+        within the stream's current size.
+        """
+        self.__write_primitive_at__(offset, val, __STR_U32_BE__, __STR_U32_LE__)
+
+    def write_s32_at(self, offset: int, val: int):
+        """
+        Writes the specified signed int at the given offset without moving the stream position. The offset has to lie
+        within the stream's current size.
+        """
+        self.__write_primitive_at__(offset, val, __STR_S32_BE__, __STR_S32_LE__)
+
+    def write_u16_array(self, vals):
+        """Writes the specified unsigned shorts to the stream."""
+        self.__write_array__(vals, "H")
+
+    def write_s16_array(self, vals):
+        """Writes the specified signed shorts to the stream."""
+        self.__write_array__(vals, "h")
+
+    def write_u32_array(self, vals):
+        """Writes the specified unsigned ints to the stream."""
+        self.__write_array__(vals, "I")
+
+    def write_s32_array(self, vals):
+        """Writes the specified signed ints to the stream."""
+        self.__write_array__(vals, "i")
+
+    def write_f32_array(self, vals):
+        """Writes the specified single-precision floats to the stream."""
+        self.__write_array__(vals, "f")
@@ -1,4 +1,9 @@
-from .binIO import BinaryMemoryIO
+from .binIO import BinaryMemoryIO, EOFException
+import bisect
+import itertools
+import math
+import operator
+import struct
 
 
 class LMSException(Exception):
@@ -43,6 +48,27 @@ def charset_to_encoding(charset: str) -> int:
 # ----------------------------------------------------------------------------------------------------------------------
 # Hash tables
 # ----------------------------------------------------------------------------------------------------------------------
+def __sieve_primes__(limit: int) -> list[int]:
+    """
+    Finds all prime numbers up to and including the specified limit using the sieve of Eratosthenes.
+
+    :param limit: the largest number to check.
+    :return: the sorted list of prime numbers.
+    """
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[:2] = bytes(2)
+
+    for i in range(2, math.isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit + 1, i)))
+
+    return [i for i, is_prime in enumerate(sieve) if is_prime]
+
+
+# Bucket counts are derived from the number of labels, which rarely exceeds a few thousand
+__PRIMES__ = __sieve_primes__(20000)
+
+
 def find_greater_prime(val: int) -> int:
     """
     Calculates and returns the first prime number that is greater than the specified input value. This is loosely based
@@ -51,6 +77,12 @@ def find_greater_prime(val: int) -> int:
     :param val: the starting value.
     :return: the first prime number that follows the input value.
     """
+    # Look up small values in the table of precomputed primes
+    index = bisect.bisect_right(__PRIMES__, val)
+
+    if index < len(__PRIMES__):
+        return __PRIMES__[index]
+
     # Standard cases
     if val < 5:
         if val < 2:   # Only even prime number
@@ -68,10 +100,12 @@ def find_greater_prime(val: int) -> int:
             continue
 
         i = 5
+        limit = math.isqrt(val)
         prime = True
-        while i * i <= val and prime:
+        while i <= limit:
             if val % i == 0 or val % (i + 2) == 0:
                 prime = False
+                break
             i += 6
 
         if prime:
@@ -82,6 +116,59 @@ def find_greater_prime(val: int) -> int:
     return val
 
 
+def find_greater_power_of_two(val: int) -> int:
+    """
+    Calculates and returns the first power of two that is at least twice as large as the specified input value. Used
+    as the number of hash buckets, it keeps the buckets at most half full.
+
+    :param val: the starting value.
+    :return: the first power of two that is at least twice the input value, but no less than 2.
+    """
+    return 1 << (2 * val - 1).bit_length() if val > 0 else 2
+
+
+# Powers of the hash multiplier modulo 2^32. Labels are at most 255 bytes long, so this covers every label's hash.
+__HASH_POWERS__ = [pow(0x492, i, 1 << 32) for i in range(256)]
+
+
+def calc_hash(encoded_string: bytes) -> int:
+    """
+    Calculates the 32-bit hash over the byte string that decides which hash bucket a label is placed in.
+
+    :param encoded_string: the encoded string that will be hashed.
+    :return: the hash.
+    """
+    # The hash is a polynomial in the multiplier, so it can be evaluated as the dot product of the reversed bytes and
+    # the multiplier's powers
+    if len(encoded_string) <= len(__HASH_POWERS__):
+        return sum(map(operator.mul, __HASH_POWERS__, reversed(encoded_string))) & 0xFFFFFFFF
+
+    hsh = 0
+    for b in encoded_string:
+        hsh = (hsh * 0x492 + b) & 0xFFFFFFFF
+
+    return hsh
+
+
+def calc_hashes(encoded_strings: list[bytes]) -> list[int]:
+    """
+    Calculates the hashes for all of the specified encoded strings in one pass. See ``calc_hash`` for more
+    information.
+
+    :param encoded_strings: the encoded strings that will be hashed.
+    :return: the list of hashes.
+    """
+    powers = __HASH_POWERS__
+    max_length = len(powers)
+    mul = operator.mul
+
+    return [
+        sum(map(mul, powers, reversed(encoded_string))) & 0xFFFFFFFF
+        if len(encoded_string) <= max_length else calc_hash(encoded_string)
+        for encoded_string in encoded_strings
+    ]
+
+
 def calc_hash_bucket_index(encoded_string: bytes, buckets: int) -> int:
     """
     Given the specified number of hash buckets, this function determines which bucket the label should be placed in.
@@ -92,10 +179,54 @@ def calc_hash_bucket_index(encoded_string: bytes, buckets: int) -> int:
     :param buckets: the number of hash buckets.
     :return: the hash bucket index.
     """
-    hsh = 0
-    for b in encoded_string:
-        hsh = (hsh * 0x492 + b) & 0xFFFFFFFF
-    return hsh % buckets
+    return calc_hash(encoded_string) % buckets
+
+
+def calc_hash_bucket_indices(encoded_strings: list[bytes], buckets: int) -> list[int]:
+    """
+    Determines the hash bucket indices for all of the specified encoded strings in one pass. See
+    ``calc_hash_bucket_index`` for more information.
+
+    :param encoded_strings: the encoded strings that will be hashed.
+    :param buckets: the number of hash buckets.
+    :return: the list of hash bucket indices.
+    """
+    return [hsh % buckets for hsh in calc_hashes(encoded_strings)]
+
+
+def find_best_bucket_count(encoded_strings: list[bytes], num_candidates: int = 8) -> int:
+    """
+    Finds the number of hash buckets that spreads the given encoded strings most evenly. The candidates are the first
+    prime numbers greater than the number of strings. The candidate with the shortest longest bucket wins, ties are
+    broken in favor of fewer buckets.
+
+    :param encoded_strings: the encoded strings that will be hashed.
+    :param num_candidates: the number of bucket counts to try.
+    :return: the best number of hash buckets.
+    """
+    # The hashes do not depend on the number of buckets, so they only need to be calculated once for all candidates
+    hashes = calc_hashes(encoded_strings)
+    best_buckets = num_buckets = find_greater_prime(len(encoded_strings))
+    best_depth = len(encoded_strings) + 1
+
+    for _ in range(num_candidates):
+        bucket_sizes = [0] * num_buckets
+
+        for hsh in hashes:
+            bucket_sizes[hsh % num_buckets] += 1
+
+        depth = max(bucket_sizes)
+
+        if depth < best_depth:
+            best_buckets = num_buckets
+            best_depth = depth
+
+            if depth <= 1:
+                break
+
+        num_buckets = find_greater_prime(num_buckets)
+
+    return best_buckets
 
 
 def unpack_hash_table(stream: BinaryMemoryIO) -> dict[int, str]:
@@ -107,61 +238,170 @@ def unpack_hash_table(stream: BinaryMemoryIO) -> dict[int, str]:
     """
     off_start = stream.tell()
     num_buckets = stream.read_s32()
-    off_buckets = stream.tell()
+    bucket_entries = stream.read_s32_array(num_buckets * 2)
 
+    # Parse the labels directly from the underlying buffer
+    buffer = stream.getvalue()
+    byteorder = "big" if stream.is_big_endian else "little"
     label_indices: dict[int, str] = {}
 
     for i in range(num_buckets):
-        stream.seek(off_buckets + i * 8)
-        num_entries = stream.read_s32()
-        off_labels = stream.read_s32()
-
-        stream.seek(off_start + off_labels)
+        num_entries = bucket_entries[i * 2]
+        pos = off_start + bucket_entries[i * 2 + 1]
 
         for j in range(num_entries):
-            len_label = stream.read_u8()
-            label = stream.read(len_label).decode("ascii")
-            index = stream.read_s32()
+            if pos >= len(buffer):
+                raise EOFException
+
+            off_label = pos + 1
+            off_index = off_label + buffer[pos]
+            pos = off_index + 4
+
+            if pos > len(buffer):
+                raise EOFException
+
+            label = buffer[off_label:off_index].decode("ascii")
+            index = int.from_bytes(buffer[off_index:pos], byteorder, signed=True)
             label_indices[index] = label
 
     return label_indices
 
 
-def pack_hash_table(stream: BinaryMemoryIO, labels: list[tuple[int, str]], num_buckets: int):
+def pack_hash_table(stream: BinaryMemoryIO, labels: list[tuple[int, str | bytes]], num_buckets: int):
     """
-    Packs a hash table storing the given index-label pairs and writes the resulting blob to the given stream.
+    Packs a hash table storing the given index-label pairs and writes the resulting blob to the given stream. Labels may
+    also be given as already ASCII-encoded bytes.
 
     :param stream: the stream to write to.
     :param labels: the list of index-label pairs.
     :param num_buckets: the number of hash buckets.
     """
-    # Initialize buckets and write count
-    buckets = [list() for _ in range(num_buckets)]
     stream.write_s32(num_buckets)
 
-    # Sort labels into buckets
-    for label_id, label in labels:
-        packed_label = label.encode("ascii")
+    # Encode and hash all labels at once
+    packed_labels = [label if type(label) is bytes else label.encode("ascii") for _, label in labels]
 
+    for packed_label in packed_labels:
         if len(packed_label) > 255:
-            raise LMSException(f"Label name {label} too long")
+            raise LMSException(f"Label name {packed_label.decode('ascii')} too long")
+
+    bucket_indices = calc_hash_bucket_indices(packed_labels, num_buckets)
 
-        bucket_index = calc_hash_bucket_index(packed_label, num_buckets)
-        buckets[bucket_index].append((packed_label, label_id))
+    # Sort labels by their buckets. The sort is stable, so labels keep their order within their bucket.
+    label_ids = [label_id for label_id, _ in labels]
+    entries = sorted(zip(bucket_indices, packed_labels, label_ids), key=operator.itemgetter(0))
 
-    # Write all buckets
+    # Calculate the offsets to all buckets' labels and write the bucket entries
     off_labels = 0x04 + num_buckets * 0x08
+    bucket_entries: list[int] = []
+
+    for bucket_index, bucket in itertools.groupby(entries, key=operator.itemgetter(0)):
+        bucket = list(bucket)
+        bucket_entries += (0, off_labels) * (bucket_index - len(bucket_entries) // 2)
+        bucket_entries += (len(bucket), off_labels)
+        off_labels += sum(len(packed_label) + 5 for _, packed_label, _ in bucket)
+
+    bucket_entries += (0, off_labels) * (num_buckets - len(bucket_entries) // 2)
+    stream.write_s32_array(bucket_entries)
+
+    # Write all labels
+    for _, packed_label, label_id in entries:
+        stream.write_u8(len(packed_label))
+        stream.write(packed_label)
+        stream.write_s32(label_id)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Sections
+# ----------------------------------------------------------------------------------------------------------------------
+# Header fields following the BOM (encoding, version, number of sections and file size) and section headers
+__FILE_HEADER_BE__ = struct.Struct(">2xBBH2xI10x")
+__FILE_HEADER_LE__ = struct.Struct("<2xBBH2xI10x")
+__SECTION_HEADER_BE__ = struct.Struct(">4sI8x")
+__SECTION_HEADER_LE__ = struct.Struct("<4sI8x")
+__SECTION_PADDING__ = b"\xAB" * 15
+
+
+def read_file_header(stream: BinaryMemoryIO) -> tuple[int, int, int, int]:
+    """
+    Reads the file header fields that follow the BOM in one go. The stream is expected to be positioned right after the
+    BOM and its byte order is expected to be set accordingly.
+
+    :param stream: the stream to read from.
+    :return: the encoding, version, number of sections and file size.
+    """
+    strct = __FILE_HEADER_BE__ if stream.is_big_endian else __FILE_HEADER_LE__
+    offset = stream.tell()
 
-    for bucket in buckets:
-        stream.write_s32(len(bucket))
-        stream.write_s32(off_labels)
-        next_offset = stream.tell()
-        stream.seek(off_labels)
+    try:
+        fields = strct.unpack_from(stream.getvalue(), offset)
+    except struct.error:
+        raise EOFException
 
-        for packed_label, label_id in bucket:
-            stream.write_u8(len(packed_label))
-            stream.write(packed_label)
-            stream.write_s32(label_id)
+    stream.seek(offset + strct.size)
+    return fields
 
-        off_labels = stream.tell()
-        stream.seek(next_offset)
+
+def read_section_headers(stream: BinaryMemoryIO, num_sections: int) -> list[tuple[bytes, int, int]]:
+    """
+    Reads the headers of the specified number of consecutive sections in one pass, starting at the stream's current
+    position. Each section starts at the next multiple of 16 bytes after the previous section's contents.
+
+    :param stream: the stream to read from.
+    :param num_sections: the number of sections.
+    :return: the list of each section's magic, contents offset and size.
+    """
+    strct = __SECTION_HEADER_BE__ if stream.is_big_endian else __SECTION_HEADER_LE__
+    buffer = stream.getvalue()
+    offset = stream.tell()
+    sections: list[tuple[bytes, int, int]] = []
+
+    try:
+        for _ in range(num_sections):
+            magic, size = strct.unpack_from(buffer, offset)
+            offset += strct.size
+            sections.append((magic, offset, size))
+            offset = (offset + size + 15) & ~15
+    except struct.error:
+        raise EOFException
+
+    return sections
+
+
+def begin_section(stream: BinaryMemoryIO, magic: bytes) -> int:
+    """
+    Writes the header of a new section with the specified magic to the stream. The section's size is left blank and will
+    be filled in by ``end_section`` once all of the section's contents have been written directly after the header.
+
+    :param stream: the stream to write to.
+    :param magic: the section's magic.
+    :return: the offset of the section's contents.
+    """
+    stream.write(magic)
+    stream.write_u32(0)
+    stream.write(bytes(8))
+    return stream.tell()
+
+
+def end_section(stream: BinaryMemoryIO, offset: int):
+    """
+    Fills in the size of the section whose contents start at the given offset and pads the stream to the next multiple
+    of 16 bytes. The section is expected to span to the end of the stream.
+
+    :param stream: the stream to write to.
+    :param offset: the offset of the section's contents.
+    """
+    size = stream.size
+    stream.write_u32_at(offset - 0x0C, size - offset)
+    stream.seek(size)
+    pad_section(stream)
+
+
+def pad_section(stream: BinaryMemoryIO):
+    """
+    Pads the stream with 0xAB bytes to the next multiple of 16 bytes. The stream is expected to be positioned at its
+    end.
+
+    :param stream: the stream to write to.
+    """
+    stream.write(__SECTION_PADDING__[:-stream.size & 15])
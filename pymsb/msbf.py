@@ -1,3 +1,5 @@
+from collections import deque
+import struct
 from .binIO import *
 from .adapter import LMSAdapter
 from .helper import LMSException
@@ -8,6 +10,11 @@ __all__ = ["LMSFlowNode", "LMSEntryNode", "LMSMessageNode", "LMSBranchNode", "LM
 
 
 class LMSFlowNode:
+    __slots__ = ("next_node", "arg0", "arg1", "arg2", "arg3", "arg4")
+
+    _ARGS_BE_ = struct.Struct(">5H")
+    _ARGS_LE_ = struct.Struct("<5H")
+
     def __init__(self):
         self.next_node: LMSFlowNode | None = None
         self.arg0: int = 0
@@ -20,35 +27,47 @@ class LMSFlowNode:
         raise NotImplementedError
 
     def read(self, stream: BinaryMemoryIO):
-        self.arg0 = stream.read_u16()
-        self.arg1 = stream.read_u16()
-        self.arg2 = stream.read_u16()
-        self.arg3 = stream.read_u16()
-        self.arg4 = stream.read_u16()
+        strct = self._ARGS_BE_ if stream.is_big_endian else self._ARGS_LE_
+        raw = stream.read(strct.size)
+
+        if len(raw) != strct.size:
+            raise EOFException
+
+        self.arg0, self.arg1, self.arg2, self.arg3, self.arg4 = strct.unpack(raw)
 
     def write(self, stream: BinaryMemoryIO):
-        stream.write_u16(self.arg0)
-        stream.write_u16(self.arg1)
-        stream.write_u16(self.arg2)
-        stream.write_u16(self.arg3)
-        stream.write_u16(self.arg4)
+        strct = self._ARGS_BE_ if stream.is_big_endian else self._ARGS_LE_
+        stream.write(strct.pack(self.arg0, self.arg1, self.arg2, self.arg3, self.arg4))
 
 
 class LMSEntryNode(LMSFlowNode):
+    __slots__ = ("label", "_packed_label_")
+
     def __init__(self):
         super(LMSEntryNode, self).__init__()
         self.arg1 = 0xFFFF
 
         self.label: str = ""
+        self._packed_label_: tuple[str, bytes] | None = None
 
     def node_type(self) -> int:
         return 4
 
+    @property
+    def packed_label(self) -> bytes:
+        """The label encoded in ASCII. The encoded label is reused as long as the label stays the same."""
+        if self._packed_label_ is None or self._packed_label_[0] is not self.label:
+            self._packed_label_ = (self.label, self.label.encode("ascii"))
+
+        return self._packed_label_[1]
+
     def __repr__(self):
         return self.label
 
 
 class LMSMessageNode(LMSFlowNode):
+    __slots__ = ("message_label",)
+
     def __init__(self):
         super(LMSMessageNode, self).__init__()
         self.arg1 = 0x88
@@ -70,6 +89,8 @@ class LMSMessageNode(LMSFlowNode):
 
 
 class LMSBranchNode(LMSFlowNode):
+    __slots__ = ("next_node_else",)
+
     def __init__(self):
         super(LMSBranchNode, self).__init__()
         self.arg1 = 2
@@ -96,6 +117,8 @@ class LMSBranchNode(LMSFlowNode):
 
 
 class LMSEventNode(LMSFlowNode):
+    __slots__ = ()
+
     def __init__(self):
         super(LMSEventNode, self).__init__()
         self.arg2 = 0xFFFF
@@ -132,6 +155,12 @@ class LMSFlows:
     _MAGIC_FLW2_ = b'FLW2'
     _MAGIC_FEN1_ = b'FEN1'
     _MAGIC_REF1_ = b'REF1'
+    _NODE_TYPES_: dict[int, type[LMSFlowNode]] = {
+        1: LMSMessageNode,
+        2: LMSBranchNode,
+        3: LMSEventNode,
+        4: LMSEntryNode
+    }
 
     def __init__(self, adapter_maker: type[LMSAdapter]):
         if not adapter_maker.supports_flows:
@@ -140,9 +169,10 @@ class LMSFlows:
         self._flowcharts_: list[LMSEntryNode] = []
         self._adapter_: LMSAdapter = adapter_maker()
 
-        self._temp_nodes_: list[LMSFlowNode]
-        self._temp_labels_: dict[int, str]
-        self._temp_indices_: list[int]
+        self._temp_nodes_: list[LMSFlowNode] | None = None
+        self._temp_node_indices_: dict[LMSFlowNode, int] | None = None
+        self._temp_labels_: dict[int, str] | None = None
+        self._temp_indices_: list[int] | None = None
 
     @property
     def flowcharts(self) -> list[LMSEntryNode]:
@@ -218,12 +248,7 @@ class LMSFlows:
             raise BOMException("No proper UTF-16 BOM found")
 
         # Read remaining header stuff
-        stream.skip(3)
-        version = stream.read_u8()
-        num_sections = stream.read_u16()
-        stream.skip(2)
-        file_size = stream.read_u32()
-        stream.skip(10)
+        _, version, num_sections, file_size = helper.read_file_header(stream)
 
         # Verify header contents
         if version != 3:
@@ -239,26 +264,13 @@ class LMSFlows:
             self._adapter_.set_little_endian()
 
         # Parse all sections
-        current_section_offset = 32
-        stream.seek(current_section_offset)
-
-        for i in range(num_sections):
-            section_magic = stream.read(4)
-            section_size = stream.read_u32()
-            stream.skip(8)
-            section_offset = stream.tell()
+        stream.seek(32)
 
-            if section_magic == self._MAGIC_FLW2_:
-                self._unpack_flw2_(stream, section_offset, section_size)
+        for section_magic, section_offset, section_size in helper.read_section_headers(stream, num_sections):
+            section_unpacker = self._SECTION_UNPACKERS_.get(section_magic)
 
-            if section_magic == self._MAGIC_FEN1_:
-                self._unpack_fen1_(stream, section_offset, section_size)
-
-            if section_magic == self._MAGIC_REF1_:
-                self._unpack_ref1_(stream, section_offset, section_size)
-
-            current_section_offset = (section_offset + section_size + 15) & ~15
-            stream.seek(current_section_offset)
+            if section_unpacker is not None:
+                getattr(self, section_unpacker)(stream, section_offset, section_size)
 
         # Verify contents
         if self._temp_nodes_ is None:
@@ -267,39 +279,50 @@ class LMSFlows:
         if self._temp_labels_ is None:
             raise LMSException("No labels section (FEN1) found")
 
-        def try_get_node(next_node_idx: int) -> LMSFlowNode | None:
-            if next_node_idx == 0xFFFF:
-                return None
-            elif next_node_idx < len(self._temp_nodes_):
-                return self._temp_nodes_[next_node_idx]
-            else:
-                raise LMSException(f"No node at index {next_node_idx} found")
+        # Join nodes and labels, the joiners are looked up on the instance so that overrides are honored
+        node_joiners = {node_type: getattr(self, name) for node_type, name in self._NODE_JOINERS_.items()}
 
-        # Join nodes and labels
         for i, node in enumerate(self._temp_nodes_):
-            if type(node) == LMSEntryNode:
-                if i in self._temp_labels_:
-                    node.label = self._temp_labels_[i]
-                else:
-                    raise LMSException(f"No label for entry node {i}")
+            node_joiners[type(node)](i, node)
 
-                self._flowcharts_.append(node)
-                node.next_node = try_get_node(node.arg1)
+        # Cleanup
+        self._temp_labels_ = None
+        self._temp_nodes_ = None
+        self._temp_indices_ = None
+
+    def _try_get_temp_node_(self, next_node_idx: int) -> LMSFlowNode | None:
+        if next_node_idx == 0xFFFF:
+            return None
+        elif next_node_idx < len(self._temp_nodes_):
+            return self._temp_nodes_[next_node_idx]
+        else:
+            raise LMSException(f"No node at index {next_node_idx} found")
 
-            elif type(node) == LMSMessageNode:
-                node.next_node = try_get_node(node.arg3)
+    def _join_entry_node_(self, i: int, node: LMSEntryNode):
+        if i in self._temp_labels_:
+            node.label = self._temp_labels_[i]
+        else:
+            raise LMSException(f"No label for entry node {i}")
 
-            elif type(node) == LMSBranchNode:
-                node.next_node = try_get_node(self._temp_indices_[node.arg4])
-                node.next_node_else = try_get_node(self._temp_indices_[node.arg4 + 1])
+        self._flowcharts_.append(node)
+        node.next_node = self._try_get_temp_node_(node.arg1)
 
-            elif type(node) == LMSEventNode:
-                node.next_node = try_get_node(node.arg2)
+    def _join_message_node_(self, i: int, node: LMSMessageNode):
+        node.next_node = self._try_get_temp_node_(node.arg3)
 
-        # Cleanup
-        del self._temp_labels_
-        del self._temp_nodes_
-        del self._temp_indices_
+    def _join_branch_node_(self, i: int, node: LMSBranchNode):
+        node.next_node = self._try_get_temp_node_(self._temp_indices_[node.arg4])
+        node.next_node_else = self._try_get_temp_node_(self._temp_indices_[node.arg4 + 1])
+
+    def _join_event_node_(self, i: int, node: LMSEventNode):
+        node.next_node = self._try_get_temp_node_(node.arg2)
+
+    _NODE_JOINERS_ = {
+        LMSEntryNode: "_join_entry_node_",
+        LMSMessageNode: "_join_message_node_",
+        LMSBranchNode: "_join_branch_node_",
+        LMSEventNode: "_join_event_node_"
+    }
 
     def _unpack_flw2_(self, stream: BinaryMemoryIO, offset: int, size: int):
         stream.seek(offset)
@@ -308,29 +331,23 @@ class LMSFlows:
         num_indices = stream.read_u16()
         stream.skip(4)
 
-        # Read all nodes
+        # Read all nodes at once, each one consists of its type followed by five arguments
+        node_data = stream.read_u16_array(num_nodes * 6)
         self._temp_nodes_ = []
 
-        for _ in range(num_nodes):
-            node: LMSFlowNode
-            node_type = stream.read_u16()
-
-            if node_type == 1:
-                node = LMSMessageNode()
-            elif node_type == 2:
-                node = LMSBranchNode()
-            elif node_type == 3:
-                node = LMSEventNode()
-            elif node_type == 4:
-                node = LMSEntryNode()
-            else:
+        for i in range(0, len(node_data), 6):
+            node_type = node_data[i]
+            node_maker = self._NODE_TYPES_.get(node_type)
+
+            if node_maker is None:
                 raise LMSException(f"Unknown flow node type {node_type}")
 
-            node.read(stream)
+            node = node_maker()
+            node.arg0, node.arg1, node.arg2, node.arg3, node.arg4 = node_data[i + 1:i + 6]
             self._temp_nodes_.append(node)
 
         # Read all branch indices
-        self._temp_indices_ = [stream.read_u16() for _ in range(num_indices)]
+        self._temp_indices_ = stream.read_u16_array(num_indices).tolist()
 
     def _unpack_fen1_(self, stream: BinaryMemoryIO, offset: int, size: int):
         stream.seek(offset)
@@ -339,6 +356,12 @@ class LMSFlows:
     def _unpack_ref1_(self, stream: BinaryMemoryIO, offset: int, size: int):
         raise NotImplementedError("REF1 not supported yet")
 
+    _SECTION_UNPACKERS_ = {
+        _MAGIC_FLW2_: "_unpack_flw2_",
+        _MAGIC_FEN1_: "_unpack_fen1_",
+        _MAGIC_REF1_: "_unpack_ref1_"
+    }
+
     # ------------------------------------------------------------------------------------------------------------------
     # Packing
     # ------------------------------------------------------------------------------------------------------------------
@@ -365,51 +388,56 @@ class LMSFlows:
         self._pack_fen1_(stream)
         num_sections = 2
 
+        # Cleanup
+        self._temp_nodes_ = None
+        self._temp_node_indices_ = None
+        self._temp_indices_ = None
+
         # Update header and get result
-        stream.seek(0x000E)
-        stream.write_u16(num_sections)
-        stream.seek(0x0012)
-        stream.write_u32(stream.size)
+        stream.write_u16_at(0x000E, num_sections)
+        stream.write_u32_at(0x0012, stream.size)
 
-        result = stream.getbuffer().tobytes()
-        del stream
-        return result
+        return stream.getvalue()
 
     def _pack_flw2_(self, main_stream: BinaryMemoryIO):
         self._temp_nodes_ = []
+        self._temp_node_indices_ = {}
         self._temp_indices_ = []
 
         # Flatten all flowcharts
         for flowchart in self._flowcharts_:
-            remaining_nodes = [flowchart]
+            remaining_nodes = deque([flowchart])
 
             while len(remaining_nodes):
-                node = remaining_nodes.pop(0)
+                node = remaining_nodes.popleft()
                 next_node = node.next_node
 
-                if node not in self._temp_nodes_:
+                if node not in self._temp_node_indices_:
+                    self._temp_node_indices_[node] = len(self._temp_nodes_)
                     self._temp_nodes_.append(node)
 
-                if next_node is not None and next_node not in self._temp_nodes_:
+                if next_node is not None and next_node not in self._temp_node_indices_:
                     remaining_nodes.append(node.next_node)
 
                 if type(node) == LMSBranchNode:
                     next_node = node.next_node_else
 
-                    if next_node is not None and next_node not in self._temp_nodes_:
+                    if next_node is not None and next_node not in self._temp_node_indices_:
                         remaining_nodes.append(node.next_node_else)
 
-        # Prepare header and stream
+        # Write section header and contents directly to the main stream
         num_nodes = len(self._temp_nodes_)
-        initial_capacity = 0x08 + num_nodes * 0x0C
 
-        stream = self._adapter_.create_stream(initial_capacity)
-        stream.write_u16(num_nodes)
-        stream.skip(6)
+        section_offset = helper.begin_section(main_stream, self._MAGIC_FLW2_)
+        main_stream.write_u16(num_nodes)
+        main_stream.write(bytes(6))
+
+        # Write all nodes, the node type struct is picked once for the stream's byte order
+        pack_node_type = struct.Struct(">H" if main_stream.is_big_endian else "<H").pack
+        write = main_stream.write
 
-        # Write all nodes
         def get_node_index(node: LMSFlowNode) -> int:
-            return 0xFFFF if node is None else self._temp_nodes_.index(node)
+            return 0xFFFF if node is None else self._temp_node_indices_[node]
 
         for node in self._temp_nodes_:
             if type(node) == LMSEntryNode:
@@ -426,48 +454,31 @@ class LMSFlows:
             elif type(node) == LMSEventNode:
                 node.arg2 = get_node_index(node.next_node)
 
-            stream.write_u16(node.node_type())
-            node.write(stream)
+            write(pack_node_type(node.node_type()))
+            node.write(main_stream)
 
         # Write branch indices
-        for index in self._temp_indices_:
-            stream.write_u16(index)
-
-        stream.seek(0x0002)
-        stream.write_u16(len(self._temp_indices_))
-
-        # Write section to main stream
-        main_stream.write(self._MAGIC_FLW2_)
-        main_stream.write_u32(stream.size)
-        main_stream.skip(8)
-        main_stream.write(stream.getbuffer().tobytes())
-
-        while main_stream.size & 15:
-            main_stream.write_u8(0xAB)
+        main_stream.write_u16_array(self._temp_indices_)
 
-        del stream
+        main_stream.write_u16_at(section_offset + 0x02, len(self._temp_indices_))
+        helper.end_section(main_stream, section_offset)
 
     def _pack_fen1_(self, main_stream: BinaryMemoryIO):
+        indices_and_labels = [(self._temp_node_indices_[f], f.packed_label) for f in self._flowcharts_]
+
         if self._adapter_.use_fixed_buckets:
             num_buckets = 59
+        elif self._adapter_.supports_pow2_buckets:
+            num_buckets = helper.find_greater_power_of_two(len(self._flowcharts_))
+        elif self._adapter_.optimize_buckets:
+            num_buckets = helper.find_best_bucket_count([label for _, label in indices_and_labels])
         else:
             num_buckets = helper.find_greater_prime(len(self._flowcharts_))
 
-        # Create stream and write hash table
-        stream = self._adapter_.create_stream(0x04 + num_buckets * 0x08)
-        indices_and_labels = [(self._temp_nodes_.index(f), f.label) for f in self._flowcharts_]
-        helper.pack_hash_table(stream, indices_and_labels, num_buckets)
-
-        # Write section to main stream
-        main_stream.write(self._MAGIC_FEN1_)
-        main_stream.write_u32(stream.size)
-        main_stream.skip(8)
-        main_stream.write(stream.getbuffer().tobytes())
-
-        while main_stream.size & 15:
-            main_stream.write_u8(0xAB)
-
-        del stream
+        # Write section header and hash table directly to the main stream
+        section_offset = helper.begin_section(main_stream, self._MAGIC_FEN1_)
+        helper.pack_hash_table(main_stream, indices_and_labels, num_buckets)
+        helper.end_section(main_stream, section_offset)
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -1,4 +1,5 @@
 from typing import Any
+import struct
 from .binIO import *
 from .adapter import LMSAdapter
 from .helper import LMSException
@@ -12,12 +13,104 @@ class LMSMessage:
     Represents an individual message entry that belongs to an LMSDocument. It always has a label and text, but some
     games support additional attributes and a style value.
     """
+    __slots__ = ("_label_", "_document_", "text", "attributes", "style")
+
     def __init__(self, text: str):
-        self.label = ""
+        self._label_ = ""
+        self._document_: LMSDocument | None = None
         self.text = text
         self.attributes = {}
         self.style = -1
 
+    @property
+    def label(self) -> str:
+        """The message's label."""
+        return self._label_
+
+    @label.setter
+    def label(self, label: str):
+        # Keep the label index of the owning document in sync
+        document = self._document_
+
+        if document is None:
+            self._label_ = label
+        else:
+            document._unindex_message_(self)
+            self._label_ = label
+            document._index_message_(self)
+
+
+class __LMSMessageList__(list):
+    """
+    The list of messages that belongs to an LMSDocument. Adding, replacing or removing messages updates the document's
+    label index accordingly.
+    """
+    __slots__ = ("_document_",)
+
+    def __init__(self, document: "LMSDocument", messages=()):
+        super().__init__(messages)
+        self._document_ = document
+
+    def __reduce__(self):
+        return self.__class__, (self._document_, list(self))
+
+    def append(self, message: LMSMessage):
+        self._document_._claim_messages_((message,))
+        super().append(message)
+        self._document_._sync_messages_((), (message,))
+
+    def insert(self, index, message: LMSMessage):
+        self._document_._claim_messages_((message,))
+        super().insert(index, message)
+        self._document_._sync_messages_((), (message,))
+
+    def extend(self, messages):
+        messages = list(messages)
+        self._document_._claim_messages_(messages)
+        super().extend(messages)
+        self._document_._sync_messages_((), messages)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def __imul__(self, count):
+        removed = list(self) if count <= 0 else ()
+        super().__imul__(count)
+        self._document_._sync_messages_(removed, ())
+        return self
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            removed = self[index]
+            added = list(value)
+        else:
+            removed = (self[index],)
+            added = (value,)
+
+        self._document_._claim_messages_(added)
+        super().__setitem__(index, added if isinstance(index, slice) else value)
+        self._document_._sync_messages_(removed, added)
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else (self[index],)
+        super().__delitem__(index)
+        self._document_._sync_messages_(removed, ())
+
+    def remove(self, message: LMSMessage):
+        super().remove(message)
+        self._document_._sync_messages_((message,), ())
+
+    def pop(self, index=-1) -> LMSMessage:
+        message = super().pop(index)
+        self._document_._sync_messages_((message,), ())
+        return message
+
+    def clear(self):
+        removed = list(self)
+        super().clear()
+        self._document_._sync_messages_(removed, ())
+
 
 class LMSDocument:
     """
@@ -25,6 +118,9 @@ class LMSDocument:
     however, game-dependent features need to be handled by custom adapter classes. See LMSAdapter for detailed for more
     information.
     """
+    __slots__ = ("_messages_", "_messages_by_label_", "_duplicate_labels_", "_adapter_", "_temp_labels_",
+                 "_temp_attrs_", "_temp_styles_")
+
     _MAGIC_HEADER_ = b"MsgStdBn"
     _MAGIC_LBL1_ = b'LBL1'
     _MAGIC_TXT2_ = b'TXT2'
@@ -33,16 +129,21 @@ class LMSDocument:
     _MAGIC_TSY1_ = b'TSY1'
 
     def __init__(self, adapter_maker: type[LMSAdapter]):
-        self._messages_: list[LMSMessage] = []
+        self._messages_: list[LMSMessage] = __LMSMessageList__(self)
+        self._messages_by_label_: dict[str, LMSMessage] = {}
+        self._duplicate_labels_: dict[str, list[LMSMessage]] = {}
         self._adapter_: LMSAdapter = adapter_maker()
 
-        self._temp_labels_: dict[int, str]
-        self._temp_attrs_: list[dict[str, Any]]
-        self._temp_styles_: list[int]
+        self._temp_labels_: dict[int, str] | None = None
+        self._temp_attrs_: list[dict[str, Any]] | None = None
+        self._temp_styles_: list[int] | None = None
 
     @property
     def messages(self) -> list[LMSMessage]:
-        """The list of message entries."""
+        """
+        The list of message entries. A message can only belong to one document at a time, adding a message that is
+        still in another document's list raises an LMSException.
+        """
         return self._messages_
 
     @property
@@ -86,6 +187,59 @@ class LMSDocument:
         """True if little endian byte order should be used, otherwise False."""
         return self._adapter_.is_little_endian
 
+    def get_message_by_label(self, label: str) -> LMSMessage | None:
+        """
+        Returns the message entry with the given label or None if no such entry exists.
+
+        :param label: the message's label.
+        :return: the message entry or None.
+        """
+        return self._messages_by_label_.get(label)
+
+    def _index_labels_(self):
+        self._messages_by_label_ = {}
+        self._duplicate_labels_ = {}
+
+        for message in self._messages_:
+            message._document_ = self
+            self._index_message_(message)
+
+    def _index_message_(self, message: LMSMessage):
+        # The first message with a label is looked up, any others are kept aside in case it is renamed or removed
+        label = message._label_
+
+        if self._messages_by_label_.setdefault(label, message) is not message:
+            self._duplicate_labels_.setdefault(label, []).append(message)
+
+    def _unindex_message_(self, message: LMSMessage):
+        label = message._label_
+        duplicates = self._duplicate_labels_.get(label)
+
+        if self._messages_by_label_.get(label) is message:
+            if duplicates:
+                self._messages_by_label_[label] = duplicates.pop(0)
+            else:
+                del self._messages_by_label_[label]
+        elif duplicates and message in duplicates:
+            duplicates.remove(message)
+
+        if duplicates is not None and not duplicates:
+            del self._duplicate_labels_[label]
+
+    def _claim_messages_(self, messages):
+        for message in messages:
+            if message._document_ is not None and message._document_ is not self:
+                raise LMSException(f"The message {message.label} already belongs to another document!")
+
+    def _sync_messages_(self, removed, added):
+        for message in removed:
+            self._unindex_message_(message)
+            message._document_ = None
+
+        for message in added:
+            message._document_ = self
+            self._index_message_(message)
+
     def new_message(self, label: str) -> LMSMessage:
         """
         Creates and returns a new message entry using the given label and adds it to the list of messages. If an entry
@@ -95,9 +249,8 @@ class LMSDocument:
         :return: the new message entry.
         """
         # Check if message with label already exists
-        for message in self._messages_:
-            if message.label == label:
-                raise LMSException(f"A message with the label {label} already exists!")
+        if self.get_message_by_label(label) is not None:
+            raise LMSException(f"A message with the label {label} already exists!")
 
         # Create and append new message
         message = LMSMessage("")
@@ -132,13 +285,7 @@ class LMSDocument:
             raise BOMException("No proper UTF-16 BOM found")
 
         # Read remaining header stuff
-        stream.skip(2)
-        encoding = stream.read_u8()
-        version = stream.read_u8()
-        num_sections = stream.read_u16()
-        stream.skip(2)
-        file_size = stream.read_u32()
-        stream.skip(10)
+        encoding, version, num_sections, file_size = helper.read_file_header(stream)
 
         # Verify header contents
         if version != 3:
@@ -156,32 +303,13 @@ class LMSDocument:
         self._adapter_.charset = helper.encoding_to_charset(encoding, stream.is_big_endian)
 
         # Parse all sections
-        current_section_offset = 32
-        stream.seek(current_section_offset)
-
-        for i in range(num_sections):
-            section_magic = stream.read(4)
-            section_size = stream.read_u32()
-            stream.skip(8)
-            section_offset = stream.tell()
-
-            if section_magic == self._MAGIC_LBL1_:
-                self._unpack_lbl1_(stream, section_offset, section_size)
+        stream.seek(32)
 
-            elif section_magic == self._MAGIC_TXT2_:
-                self._unpack_txt2_(stream, section_offset, section_size)
+        for section_magic, section_offset, section_size in helper.read_section_headers(stream, num_sections):
+            section_unpacker = self._SECTION_UNPACKERS_.get(section_magic)
 
-            elif section_magic == self._MAGIC_ATR1_:
-                self._unpack_atr1_(stream, section_offset, section_size)
-
-            elif section_magic == self._MAGIC_ATO1_:
-                self._unpack_ato1_(stream, section_offset, section_size)
-
-            elif section_magic == self._MAGIC_TSY1_:
-                self._unpack_tsy1_(stream, section_offset, section_size)
-
-            current_section_offset = (section_offset + section_size + 15) & ~15
-            stream.seek(current_section_offset)
+            if section_unpacker is not None:
+                getattr(self, section_unpacker)(stream, section_offset, section_size)
 
         # Verify contents
         has_attributes = self._adapter_.supports_attributes
@@ -197,33 +325,44 @@ class LMSDocument:
             raise LMSException("No styles section found")
 
         # Join messages, labels, attributes & styles
-        for i, message in enumerate(self._messages_):
-            if self._temp_labels_:
-                if i in self._temp_labels_:
-                    message.label = self._temp_labels_[i]
-                else:
-                    raise LMSException(f"No label for message no. {i}")
+        messages = self._messages_
+        labels = self._temp_labels_
 
-            if has_attributes:
-                if i < len(self._temp_attrs_):
-                    message.attributes = self._temp_attrs_[i]
-                else:
-                    message.attributes = self._adapter_.create_default_attributes()
+        if labels:
+            for i, message in enumerate(messages):
+                label = labels.get(i)
 
-            if has_styles:
-                if i < len(self._temp_styles_):
-                    message.style = self._temp_styles_[i]
-                else:
-                    message.style = self._adapter_.create_default_style()
+                if label is None:
+                    raise LMSException(f"No label for message no. {i}")
 
-        # Cleanup
-        del self._temp_labels_
+                message._label_ = label
 
         if has_attributes:
-            del self._temp_attrs_
+            all_attributes = self._temp_attrs_
+            create_default_attributes = self._adapter_.create_default_attributes
+
+            for message, attributes in zip(messages, all_attributes):
+                message.attributes = attributes
+
+            for message in messages[len(all_attributes):]:
+                message.attributes = create_default_attributes()
 
         if has_styles:
-            del self._temp_styles_
+            all_styles = self._temp_styles_
+            create_default_style = self._adapter_.create_default_style
+
+            for message, style in zip(messages, all_styles):
+                message.style = style
+
+            for message in messages[len(all_styles):]:
+                message.style = create_default_style()
+
+        self._index_labels_()
+
+        # Cleanup
+        self._temp_labels_ = None
+        self._temp_attrs_ = None
+        self._temp_styles_ = None
 
     def _unpack_lbl1_(self, stream: BinaryMemoryIO, offset: int, size: int):
         stream.seek(offset)
@@ -232,14 +371,18 @@ class LMSDocument:
     def _unpack_txt2_(self, stream: BinaryMemoryIO, offset: int, size: int):
         stream.seek(offset)
         num_entries = stream.read_s32()
+        text_offsets = stream.read_u32_array(num_entries)
 
-        for i in range(num_entries):
-            stream.seek(offset + 0x04 + i * 0x04)
-            off_text = stream.read_u32()
-            stream.seek(offset + off_text)
+        read_text = self._adapter_.read_text
+        seek = stream.seek
+        texts: list[str] = []
+        append_text = texts.append
 
-            message = LMSMessage(self._adapter_.read_text(stream))
-            self._messages_.append(message)
+        for off_text in text_offsets:
+            seek(offset + off_text)
+            append_text(read_text(stream))
+
+        self._messages_ += map(LMSMessage, texts)
 
     def _unpack_atr1_(self, stream: BinaryMemoryIO, offset: int, size: int):
         if not self._adapter_.supports_attributes:
@@ -249,15 +392,52 @@ class LMSDocument:
         num_entries = stream.read_s32()
         len_entries = stream.read_s32()
 
+        # Flat records can be unpacked all at once
+        attributes_struct = self._get_attributes_struct_(stream)
+
+        if attributes_struct is not None:
+            if attributes_struct.size != len_entries:
+                raise LMSException("Attributes format does not match the attributes size")
+
+            start = offset + 0x08
+            end = start + num_entries * len_entries
+            buffer = stream.getvalue()
+
+            if end > len(buffer):
+                raise EOFException
+
+            fields = self._adapter_.attributes_fields
+            records = attributes_struct.iter_unpack(buffer[start:end])
+            self._temp_attrs_ = [dict(zip(fields, values)) for values in records]
+            return
+
         all_attributes: list[dict[str, Any]] = []
+        parse_attributes = self._adapter_.parse_attributes
+        seek = stream.seek
+
+        # Attributes may refer to data elsewhere in the section, so every entry is still read from its own offset
+        off_entries = offset + 0x08
 
         for i in range(num_entries):
-            stream.seek(offset + 0x08 + i * len_entries)
-            attributes = self._adapter_.parse_attributes(stream, offset, size)
-            all_attributes.append(attributes)
+            seek(off_entries + i * len_entries)
+            all_attributes.append(parse_attributes(stream, offset, size))
 
         self._temp_attrs_ = all_attributes
 
+    def _get_attributes_struct_(self, stream: BinaryMemoryIO) -> struct.Struct | None:
+        attributes_format = self._adapter_.attributes_format
+
+        if attributes_format is None:
+            return None
+
+        attributes_struct = struct.Struct((">" if stream.is_big_endian else "<") + attributes_format)
+        num_items = len(attributes_struct.unpack(bytes(attributes_struct.size)))
+
+        if num_items != len(self._adapter_.attributes_fields):
+            raise LMSException("Attributes format does not match the number of attributes fields")
+
+        return attributes_struct
+
     def _unpack_ato1_(self, stream: BinaryMemoryIO, offset: int, size: int):
         raise NotImplementedError("ATO1 not supported yet")
 
@@ -266,14 +446,15 @@ class LMSDocument:
             raise LMSException("Adapter does not support styles, cannot parse TSY1 section")
 
         stream.seek(offset)
-        num_entries = size // 4
-
-        all_styles: list[int] = []
+        self._temp_styles_ = stream.read_s32_array(size // 4).tolist()
 
-        for _ in range(num_entries):
-            all_styles.append(stream.read_s32())
-
-        self._temp_styles_ = all_styles
+    _SECTION_UNPACKERS_ = {
+        _MAGIC_LBL1_: "_unpack_lbl1_",
+        _MAGIC_TXT2_: "_unpack_txt2_",
+        _MAGIC_ATR1_: "_unpack_atr1_",
+        _MAGIC_ATO1_: "_unpack_ato1_",
+        _MAGIC_TSY1_: "_unpack_tsy1_"
+    }
 
     # ------------------------------------------------------------------------------------------------------------------
     # Packing
@@ -297,81 +478,53 @@ class LMSDocument:
         stream.write_u32(0)
         stream.skip(10)
 
-        # Pack the sections
-        num_sections = 0
-
-        self._pack_lbl1_(stream)
-        num_sections += 1
-
+        # Determine and pack the sections
         if self._adapter_.supports_attributes:
-            self._pack_atr1_(stream)
-            num_sections += 1
-
-        self._pack_txt2_(stream)
-        num_sections += 1
+            section_packers = [self._pack_lbl1_, self._pack_atr1_, self._pack_txt2_]
+        else:
+            section_packers = [self._pack_lbl1_, self._pack_txt2_]
 
         if self._adapter_.supports_styles:
-            self._pack_tsy1_(stream)
-            num_sections += 1
+            section_packers.append(self._pack_tsy1_)
+
+        for section_packer in section_packers:
+            section_packer(stream)
 
         # Update header and get result
-        stream.seek(0x000E)
-        stream.write_u16(num_sections)
-        stream.seek(0x0012)
-        stream.write_u32(stream.size)
+        stream.write_u16_at(0x000E, len(section_packers))
+        stream.write_u32_at(0x0012, stream.size)
 
-        result = stream.getbuffer().tobytes()
-        del stream
-        return result
+        return stream.getvalue()
 
     def _pack_lbl1_(self, main_stream: BinaryMemoryIO):
+        packed_labels = [m.label.encode("ascii") for m in self._messages_]
+
         if self._adapter_.use_fixed_buckets:
             num_buckets = 101
+        elif self._adapter_.optimize_buckets:
+            num_buckets = helper.find_best_bucket_count(packed_labels)
         else:
             num_buckets = helper.find_greater_prime(len(self._messages_))
 
-        # Create stream and write hash table
-        stream = self._adapter_.create_stream(0x04 + num_buckets * 0x08)
-        indices_and_labels = [(i, m.label) for i, m in enumerate(self._messages_)]
-        helper.pack_hash_table(stream, indices_and_labels, num_buckets)
-
-        # Write section to main stream
-        main_stream.write(self._MAGIC_LBL1_)
-        main_stream.write_u32(stream.size)
-        main_stream.skip(8)
-        main_stream.write(stream.getbuffer().tobytes())
-
-        while main_stream.size & 15:
-            main_stream.write_u8(0xAB)
-
-        del stream
+        # Write section header and hash table directly to the main stream
+        section_offset = helper.begin_section(main_stream, self._MAGIC_LBL1_)
+        helper.pack_hash_table(main_stream, list(enumerate(packed_labels)), num_buckets)
+        helper.end_section(main_stream, section_offset)
 
     def _pack_txt2_(self, main_stream: BinaryMemoryIO):
-        # Prepare information and stream
+        # Write section header and reserve space for the offset table
         num_messages = len(self._messages_)
-        initial_capacity = 0x04 + num_messages * 0x04
+        section_offset = helper.begin_section(main_stream, self._MAGIC_TXT2_)
+        main_stream.write_s32(num_messages)
+        main_stream.write(bytes(num_messages * 0x04))
 
-        stream = self._adapter_.create_stream(initial_capacity)
-        stream.write_s32(num_messages)
+        # Write all texts back-to-back, then fill in the offset table at once
+        texts = [message.text for message in self._messages_]
+        text_offsets = [off_text - section_offset for off_text in self._adapter_.write_texts(main_stream, texts)]
 
-        # Write all texts
-        for i, message in enumerate(self._messages_):
-            stream.seek(0x04 + i * 0x04)
-            stream.write_u32(stream.size)
-
-            stream.seek(stream.size)
-            self._adapter_.write_text(stream, message.text)
-
-        # Write section to main stream
-        main_stream.write(self._MAGIC_TXT2_)
-        main_stream.write_u32(stream.size)
-        main_stream.skip(8)
-        main_stream.write(stream.getbuffer().tobytes())
-
-        while main_stream.size & 15:
-            main_stream.write_u8(0xAB)
-
-        del stream
+        main_stream.seek(section_offset + 0x04)
+        main_stream.write_u32_array(text_offsets)
+        helper.end_section(main_stream, section_offset)
 
     def _pack_atr1_(self, main_stream: BinaryMemoryIO):
         if not self._adapter_.supports_attributes:
@@ -382,25 +535,48 @@ class LMSDocument:
         attributes_size = self._adapter_.attributes_size
         initial_capacity = 0x08 + num_attributes * attributes_size
 
+        # Flat records can be packed all at once and written directly to the main stream
+        attributes_struct = self._get_attributes_struct_(main_stream)
+
+        if attributes_struct is not None:
+            if attributes_struct.size != attributes_size:
+                raise LMSException("Attributes format does not match the attributes size")
+
+            records = bytearray(num_attributes * attributes_size)
+            fields = self._adapter_.attributes_fields
+            pack_into = attributes_struct.pack_into
+
+            for i, message in enumerate(self._messages_):
+                attributes = message.attributes
+                pack_into(records, i * attributes_size, *[attributes[field] for field in fields])
+
+            section_offset = helper.begin_section(main_stream, self._MAGIC_ATR1_)
+            main_stream.write_s32(num_attributes)
+            main_stream.write_s32(attributes_size)
+            main_stream.write(records)
+            helper.end_section(main_stream, section_offset)
+            return
+
         stream = self._adapter_.create_stream(initial_capacity)
         stream.write_s32(num_attributes)
         stream.write_s32(attributes_size)
 
         # Write all attributes
+        write_attributes = self._adapter_.write_attributes
+        seek = stream.seek
+
         for i, message in enumerate(self._messages_):
-            stream.seek(0x08 + i * attributes_size)
-            self._adapter_.write_attributes(stream, message.attributes)
+            seek(0x08 + i * attributes_size)
+            write_attributes(stream, message.attributes)
 
         # Write section to main stream
         main_stream.write(self._MAGIC_ATR1_)
         main_stream.write_u32(stream.size)
-        main_stream.skip(8)
-        main_stream.write(stream.getbuffer().tobytes())
+        main_stream.write(bytes(8))
+        with stream.getbuffer() as buffer:
+            main_stream.write(buffer)
 
-        while main_stream.size & 15:
-            main_stream.write_u8(0xAB)
-
-        del stream
+        helper.pad_section(main_stream)
 
     def _pack_ato1_(self):
         raise NotImplementedError("ATO1 not supported yet")
@@ -409,23 +585,10 @@ class LMSDocument:
         if not self._adapter_.supports_styles:
             return
 
-        # Prepare information and stream
-        stream = self._adapter_.create_stream(len(self._messages_) * 0x04)
-
-        # Write all styles
-        for message in self._messages_:
-            stream.write_s32(message.style)
-
-        # Write section to main stream
-        main_stream.write(self._MAGIC_TSY1_)
-        main_stream.write_u32(stream.size)
-        main_stream.skip(8)
-        main_stream.write(stream.getbuffer().tobytes())
-
-        while main_stream.size & 15:
-            main_stream.write_u8(0xAB)
-
-        del stream
+        # Write section header and all styles directly to the main stream
+        section_offset = helper.begin_section(main_stream, self._MAGIC_TSY1_)
+        main_stream.write_s32_array([message.style for message in self._messages_])
+        helper.end_section(main_stream, section_offset)
 
 
 # ----------------------------------------------------------------------------------------------------------------------